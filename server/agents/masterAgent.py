@@ -2,17 +2,15 @@ import os
 import re
 import time
 from typing import Annotated
-from openai import AsyncOpenAI
+from openai import NOT_GIVEN, AsyncOpenAI
 from openai.types.responses import EasyInputMessageParam
 from classes.Agent import Agent, agentClient
 from autogen_agentchat.agents import AssistantAgent
-from httpx import AsyncClient
+from classes.ConnectionManager import connectionManager
 from utils import genTTSAudio, logger, outputClean
 
 from .fileSystemAgent import FileSystemAgent
 
-http_client = AsyncClient(http2=True, timeout=30.0)
-
 paGuidance = "\nAn Agent will help you to perform different task, including file, if you want to perform such task, you have to include the term \"TASK\" after your respond to the user, and mention the task you want to perform with all relevant information of the task after the \"TASK\". For example, to create a file, you need to provide the filename, and the  exact content of the file that you want the file to contain, the task content can be delivered in your own style. Depends on the context you can provide the info on your own and not requiring user to provide it for you. Anything after the \"TASK\" will not show to the user. And anything before the \"TASK\" is your actual respond to the user, and will show to the user, such content should not contain anything that cannot be spoken, like emoji, code, any kind of formatting, listing, etc. Keep your response for the user in sentences only. You can also react to user base on the time info provided if appropriate. As a tsundere, you can choose to ignore what user asked."
 
 class MasterAgent(Agent):
@@ -39,7 +37,7 @@ When you respond to the user, you dont need to include any explanation or descri
         self.openai = AsyncOpenAI(
             base_url=os.getenv("OPENAI_URL"),
             api_key=os.getenv("OPENAI_API_KEY"),
-            http_client=http_client
+            http_client=connectionManager.get("openai")
         )
         
     def setServer(self, server):
@@ -49,17 +47,18 @@ When you respond to the user, you dont need to include any explanation or descri
         self.fileSystemAgent.setProfile(profile=profile)
         return super().setProfile(profile)
     async def addResponse(self, payload: Annotated[str, "the message pass to the assistant"]):
-        from classes.Profile import History
+        from classes.Profile import History, TTSEnabled
         setting = self.profile.setting
+        route = self.profile.turnRoute
         self.profile.addHistory(History(role="developer", name="Agent", content=payload))
         # self.profile.addHistory.append(EasyInputMessageParam(content=f'> Sent at {getHKT()}\n{payload}', role="developer"))
         input = [EasyInputMessageParam(role="system",content=setting.identity+paGuidance)] + self.profile.getRecentHistory()
         stream = await self.openai.responses.create(
             stream=True,
-            model=setting.model,
+            model=route.model,
             store=False,
-            reasoning={"effort": setting.effort},
-            text={"verbosity": setting.verbosity},
+            reasoning={"effort": route.effort},
+            text={"verbosity": route.verbosity} if route.verbosity else NOT_GIVEN,
             parallel_tool_calls=True,
             service_tier="priority",
             user="User",
@@ -68,6 +67,8 @@ When you respond to the user, you dont need to include any explanation or descri
         start_time = time.perf_counter()
 
         finalText = ""
+        async def genAudio(ttsSetting: TTSEnabled, text: str, tokenSize: int):
+            return await genTTSAudio(inputText=text, inputLang="en", tts=ttsSetting, tokenSize=tokenSize)
         async def oaiStream():
             from classes.SIOData import StreamData
             nonlocal finalText
@@ -82,6 +83,7 @@ When you respond to the user, you dont need to include any explanation or descri
                             first_delta_time = time.perf_counter()
                             ttfd = first_delta_time - start_time
                             logger.info(f"Time to first delta: {ttfd:.3f} seconds")
+                            self.profile.router.recordLatency(route.model, ttfd)
                             firstDelta = True
                         textChunk = chunk.delta
                         finalText += textChunk
@@ -92,7 +94,7 @@ When you respond to the user, you dont need to include any explanation or descri
                             if self.profile.setting.tts.enabled == True:
                                 ttsSetting = self.profile.setting.tts
                                 if bufferDeltaSize > 15 and re.compile(r"[.!?。！？]$").search(buffer):
-                                    audio = await genTTSAudio(inputText=buffer, inputLang="en", refText=ttsSetting.referenceText, refLang=ttsSetting.referenceTextLang, refPath=ttsSetting.referenceTextPath, speed=ttsSetting.outputSpeedFactor, tokenSize=bufferDeltaSize)
+                                    audio = await genAudio(ttsSetting, buffer, bufferDeltaSize)
                                     yield StreamData(txt=buffer, audio=audio)
                                     buffer = ""
                                     bufferDeltaSize = 0
@@ -101,7 +103,7 @@ When you respond to the user, you dont need to include any explanation or descri
                             else: yield StreamData(txt=textChunk)
                         elif len(outputClean(buffer)) > 0 and self.profile.setting.tts.enabled == True:
                             ttsSetting = self.profile.setting.tts
-                            audio = await genTTSAudio(inputText=buffer, inputLang="en", refText=ttsSetting.referenceText, refLang=ttsSetting.referenceTextLang, refPath=ttsSetting.referenceTextPath, speed=ttsSetting.outputSpeedFactor, tokenSize=bufferDeltaSize)
+                            audio = await genAudio(ttsSetting, buffer, bufferDeltaSize)
                             yield StreamData(txt=buffer, audio=audio)
                             buffer = ""
                             bufferDeltaSize = 0
@@ -109,7 +111,7 @@ When you respond to the user, you dont need to include any explanation or descri
                         if chunk.response.usage: logger.info(chunk.response.usage.model_dump())
                 if len(outputClean(buffer)) > 0 and self.profile.setting.tts.enabled == True:
                     ttsSetting = self.profile.setting.tts
-                    audio = await genTTSAudio(inputText=buffer, inputLang="en", refText=ttsSetting.referenceText, refLang=ttsSetting.referenceTextLang, refPath=ttsSetting.referenceTextPath, speed=ttsSetting.outputSpeedFactor, tokenSize=bufferDeltaSize)
+                    audio = await genAudio(ttsSetting, buffer, bufferDeltaSize)
                     yield StreamData(txt=buffer, audio=audio)
                     buffer = ""
                     bufferDeltaSize = 0
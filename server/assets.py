@@ -0,0 +1,134 @@
+import gzip
+import io
+import json
+import os
+from pathlib import Path
+import struct
+import uuid
+from typing import Any, Dict, List, Tuple
+from PIL import Image
+
+# bump when the output of optimizeVrm changes, so cached variants get rebuilt
+PIPELINE_VERSION = 1
+
+GLB_MAGIC = 0x46546C67
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+
+def pad4(data: bytes, fill: bytes) -> bytes:
+    return data + fill * (-len(data) % 4)
+
+
+def readGlb(data: bytes) -> Tuple[Dict[str, Any], bytes]:
+    magic, version, length = struct.unpack_from("<III", data, 0)
+    if magic != GLB_MAGIC or version != 2:
+        raise ValueError("Not a glTF 2.0 binary file")
+    gltf: Dict[str, Any] | None = None
+    binChunk = b""
+    offset = 12
+    while offset < length:
+        chunkLength, chunkType = struct.unpack_from("<II", data, offset)
+        chunk = data[offset + 8:offset + 8 + chunkLength]
+        if chunkType == CHUNK_JSON: gltf = json.loads(chunk)
+        elif chunkType == CHUNK_BIN: binChunk = chunk
+        offset += 8 + chunkLength
+    if gltf is None:
+        raise ValueError("glTF binary has no JSON chunk")
+    return gltf, binChunk
+
+
+def writeGlb(gltf: Dict[str, Any], binChunk: bytes) -> bytes:
+    jsonChunk = pad4(json.dumps(gltf, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), b" ")
+    chunks = struct.pack("<II", len(jsonChunk), CHUNK_JSON) + jsonChunk
+    if binChunk:
+        binChunk = pad4(binChunk, b"\0")
+        chunks += struct.pack("<II", len(binChunk), CHUNK_BIN) + binChunk
+    return struct.pack("<III", GLB_MAGIC, 2, 12 + len(chunks)) + chunks
+
+
+def bufferViewRefs(node: Any) -> List[Tuple[Dict[str, Any], str]]:
+    # every "bufferView" key in the document, including the ones inside extensions
+    refs: List[Tuple[Dict[str, Any], str]] = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "bufferView" and isinstance(value, int): refs.append((node, key))
+            else: refs += bufferViewRefs(value)
+    elif isinstance(node, list):
+        for value in node: refs += bufferViewRefs(value)
+    return refs
+
+
+def optimizeImage(data: bytes, maxSize: int | None, jpegQuality: int | None) -> Tuple[bytes, str | None]:
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    resized = False
+    if maxSize and max(image.size) > maxSize:
+        scale = maxSize / max(image.size)
+        image = image.resize((max(round(image.width * scale), 1), max(round(image.height * scale), 1)), Image.Resampling.LANCZOS)
+        resized = True
+    opaque = image.mode in ("RGB", "L") or (image.mode == "RGBA" and image.getchannel("A").getextrema() == (255, 255))
+    out = io.BytesIO()
+    if jpegQuality and opaque:
+        image.convert("RGB").save(out, format="JPEG", quality=jpegQuality, optimize=True)
+        mimeType = "image/jpeg"
+    else:
+        image.save(out, format="PNG", optimize=True)
+        mimeType = "image/png"
+    # keep the original bytes when re-encoding alone doesn't help
+    if not resized and len(out.getvalue()) >= len(data): return data, None
+    return out.getvalue(), mimeType
+
+
+def optimizeVrm(src: str, dst: str, maxTextureSize: int | None = None, jpegQuality: int | None = None) -> Dict[str, Any]:
+    raw = Path(src).read_bytes()
+    gltf, binChunk = readGlb(raw)
+    views: List[Dict[str, Any]] = gltf.get("bufferViews", [])
+    extensions = set(gltf.get("extensionsUsed", []))
+    # only the GLB embedded buffer is rewritten, external buffers and meshopt streams are left as is
+    rewritable = len(gltf.get("buffers", [])) == 1 and "uri" not in gltf["buffers"][0] and "EXT_meshopt_compression" not in extensions
+    stats: Dict[str, Any] = {"source": len(raw), "textures": 0, "strippedViews": 0}
+
+    if rewritable:
+        data = [binChunk[v.get("byteOffset", 0):v.get("byteOffset", 0) + v["byteLength"]] for v in views]
+
+        for image in gltf.get("images", []):
+            if "bufferView" not in image: continue
+            try:
+                optimized, mimeType = optimizeImage(data[image["bufferView"]], maxTextureSize, jpegQuality)
+            except Exception:
+                continue
+            if mimeType:
+                data[image["bufferView"]] = optimized
+                image["mimeType"] = mimeType
+                stats["textures"] += 1
+
+        refs = bufferViewRefs({k: v for k, v in gltf.items() if k != "bufferViews"})
+        used = sorted({node[key] for node, key in refs})
+        remap = {old: new for new, old in enumerate(used)}
+        stats["strippedViews"] = len(views) - len(used)
+
+        newBin = bytearray()
+        newViews = []
+        for old in used:
+            view = dict(views[old])
+            newBin += b"\0" * (-len(newBin) % 4)
+            view["byteOffset"] = len(newBin)
+            view["byteLength"] = len(data[old])
+            newBin += data[old]
+            newViews.append(view)
+        for node, key in refs: node[key] = remap[node[key]]
+        gltf["bufferViews"] = newViews
+        gltf["buffers"][0]["byteLength"] = len(newBin)
+        binChunk = bytes(newBin)
+
+    out = writeGlb(gltf, binChunk)
+    dstPath = Path(dst)
+    dstPath.parent.mkdir(parents=True, exist_ok=True)
+    for path, content in [(dstPath, out), (dstPath.with_name(dstPath.name + ".gz"), gzip.compress(out, compresslevel=9, mtime=0))]:
+        # unique per writer, two workers building the same variant must not share a temp file
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        tmp.write_bytes(content)
+        os.replace(tmp, path)
+        stats[path.suffix.lstrip(".")] = len(content)
+    return stats
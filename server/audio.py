@@ -0,0 +1,82 @@
+import io
+from typing import Tuple
+import wave
+import numpy as np
+
+# 10ms analysis frames for silence detection
+FRAME_SECONDS = 0.01
+
+
+def decodeWav(data: bytes) -> Tuple[np.ndarray, int]:
+    with wave.open(io.BytesIO(data), "rb") as w:
+        rate = w.getframerate()
+        channels = w.getnchannels()
+        width = w.getsampwidth()
+        raw = w.readframes(w.getnframes())
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise ValueError(f"Unsupported sample width: {width}")
+    return samples.reshape(-1, channels), rate
+
+
+def encodeWav(samples: np.ndarray, rate: int) -> bytes:
+    pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(samples.shape[1])
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def trimSilence(samples: np.ndarray, rate: int, thresholdDb: float = -45.0, padSeconds: float = 0.05) -> np.ndarray:
+    frame = max(int(rate * FRAME_SECONDS), 1)
+    count = len(samples) // frame
+    if count == 0: return samples
+    frames = samples[:count * frame].reshape(count, -1)
+    rms = np.sqrt(np.mean(np.square(frames), axis=1))
+    loud = np.flatnonzero(rms > 10 ** (thresholdDb / 20))
+    # nothing above the threshold, keep the clip as is, an empty wav fails to load on the client
+    if len(loud) == 0: return samples
+    pad = int(rate * padSeconds)
+    start = max(loud[0] * frame - pad, 0)
+    end = min((loud[-1] + 1) * frame + pad, len(samples))
+    return samples[start:end]
+
+
+def resample(samples: np.ndarray, rate: int, targetRate: int) -> np.ndarray:
+    if rate == targetRate or len(samples) == 0: return samples
+    # fft resampling, dropping the bins above the new nyquist doubles as the anti aliasing filter
+    length = len(samples)
+    targetLength = max(int(round(length * targetRate / rate)), 1)
+    spectrum = np.fft.rfft(samples, axis=0)
+    bins = targetLength // 2 + 1
+    if bins <= len(spectrum):
+        spectrum = spectrum[:bins]
+    else:
+        spectrum = np.concatenate([spectrum, np.zeros((bins - len(spectrum), spectrum.shape[1]), dtype=spectrum.dtype)])
+    return (np.fft.irfft(spectrum, n=targetLength, axis=0) * (targetLength / length)).astype(np.float32)
+
+
+def normalizeLoudness(samples: np.ndarray, targetDb: float, peakDb: float = -1.0) -> np.ndarray:
+    if len(samples) == 0: return samples
+    rms = np.sqrt(np.mean(np.square(samples)))
+    peak = np.max(np.abs(samples))
+    if rms == 0: return samples
+    gain = min(10 ** (targetDb / 20) / rms, 10 ** (peakDb / 20) / peak)
+    return samples * gain
+
+
+def processWav(data: bytes, trim: bool = True, mono: bool = False, sampleRate: int | None = None, loudness: float | None = None) -> bytes:
+    samples, rate = decodeWav(data)
+    if trim: samples = trimSilence(samples, rate)
+    if mono and samples.shape[1] > 1: samples = samples.mean(axis=1, keepdims=True)
+    if sampleRate: samples, rate = resample(samples, rate, sampleRate), sampleRate
+    if loudness is not None: samples = normalizeLoudness(samples, loudness)
+    return encodeWav(samples, rate)
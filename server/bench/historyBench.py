@@ -0,0 +1,165 @@
+import argparse
+import asyncio
+import inspect
+import json
+import os
+from pathlib import Path
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tomllib
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from utils import PROJECT_ROOT, loadEnv, loadJson, logger, writeJson
+loadEnv()
+os.environ.setdefault("OPENAI_API_KEY", "bench")  # the master agent client refuses to build without a key
+
+from rich.console import Console
+from rich.table import Table
+from classes.Profile import History, Profile, ProfileSetting, TTSDisabled
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+
+def genHistory(size: int, seed: int = 0) -> List[History]:
+    rng = random.Random(seed)
+    words = "sure thing the file is ready let me check that again why would you even ask me meow fine whatever".split()
+    history: List[History] = []
+    deepLeft = 0
+    while len(history) < size:
+        deepDive = None
+        if deepLeft == 0 and rng.random() < 0.002:
+            # deep dives are rare and run for a few dozen messages, most of the history is short chit-chat
+            deepLeft = rng.randint(10, 60)
+            deepDive = "start"
+        elif deepLeft > 0:
+            deepLeft -= 1
+            if deepLeft == 0: deepDive = "end"
+        role = rng.choices(["user", "assistant", "developer"], weights=[45, 45, 10])[0]
+        name = {"user": "User", "assistant": "you", "developer": rng.choice(["System", "Agent"])}[role]
+        length = rng.randint(20, 120) if deepDive or deepLeft else rng.randint(2, 25)
+        content = "" if rng.random() < 0.005 else " ".join(rng.choice(words) for _ in range(length))
+        history.append(History(deepDive=deepDive, name=name, time="2025-01-01 00:00:00 HKT+0800", role=role, content=content))  # type: ignore
+    return history
+
+
+async def measure(fn: Callable[[], Any], repeat: int, setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    async def call():
+        res = fn()
+        if inspect.isawaitable(res): await res
+
+    times: List[float] = []
+    for _ in range(repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        await call()
+        times.append(time.perf_counter() - start)
+
+    # separate run for memory, tracemalloc slows everything down
+    if setup: setup()
+    tracemalloc.start()
+    await call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": statistics.median(times), "min": min(times), "peakMB": peak / 2**20}
+
+
+async def benchSize(size: int, repeat: int, workDir: Path) -> Dict[str, Dict[str, float]]:
+    history = genHistory(size)
+    profile = Profile(
+        name=f"bench-{size}",
+        vrmPath=None,
+        setting=ProfileSetting(
+            identity="bench", model="bench", effort=None, verbosity="medium", allowedTools=None,
+            connectedMessage="The user just connected", disconnectedMessage="The user disconnected",
+            tts=TTSDisabled(enabled=False),
+        ),
+    )
+    profile.historyFile = workDir / f"history-{size}.json"
+    jsonFile = workDir / f"raw-{size}.json"
+
+    def reset():
+        profile.history = list(history)
+        profile.historyLoaded = True
+
+    reset()
+    await writeJson(jsonFile, history)
+    await profile.saveHistory()
+
+    res: Dict[str, Dict[str, float]] = {}
+    ops: Dict[str, tuple[Callable[[], Awaitable[Any] | Any], Optional[Callable[[], Any]]]] = {
+        "utils.writeJson": (lambda: writeJson(jsonFile, history), None),
+        "utils.loadJson": (lambda: loadJson(jsonFile, [], History), None),
+        "Profile.saveHistory": (profile.saveHistory, reset),
+        "Profile.loadHistory": (profile.loadHistory, reset),
+        "Profile.getRecentHistory": (profile.getRecentHistory, reset),
+        "Profile.connect": (lambda: profile.connect(continueChat=False), reset),
+        "Profile.disconnect": (profile.disconnect, reset),
+    }
+    for name, (fn, setup) in ops.items():
+        res[name] = await measure(fn, repeat=repeat, setup=setup)
+        logger.info(f"[{size}] {name}: {res[name]['seconds']:.4f}s, peak {res[name]['peakMB']:.1f}MB")
+    return res
+
+
+def gitCommit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def printResults(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    table = Table(title=f"History benchmark {results['version']} ({results['commit']})")
+    for col in ["size", "operation", "median (s)", "peak (MB)"] + (["time vs baseline", "peak vs baseline"] if baseline else []):
+        table.add_column(col, justify="left" if col == "operation" else "right")
+    for size, ops in results["results"].items():
+        for name, r in ops.items():
+            row = [size, name, f"{r['seconds']:.4f}", f"{r['peakMB']:.1f}"]
+            if baseline:
+                base = baseline["results"].get(size, {}).get(name)
+                row.append(f"{(r['seconds'] / base['seconds'] - 1) * 100:+.1f}%" if base and base["seconds"] else "-")
+                row.append(f"{(r['peakMB'] / base['peakMB'] - 1) * 100:+.1f}%" if base and base["peakMB"] else "-")
+            table.add_row(*row)
+    Console().print(table)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark the history layer at different history sizes")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", type=Path, default=None, help="result file, default bench/results/history-<version>-<commit>.json")
+    parser.add_argument("--baseline", type=Path, default=None, help="previous result file to compare against")
+    args = parser.parse_args()
+
+    with (PROJECT_ROOT / "pyproject.toml").open("rb") as f:
+        version = tomllib.load(f)["project"]["version"]
+    results: Dict[str, Any] = {
+        "version": version,
+        "commit": gitCommit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": args.repeat,
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory() as workDir:
+        for size in args.sizes:
+            results["results"][str(size)] = await benchSize(size, args.repeat, Path(workDir))
+
+    output: Path = args.output or RESULTS_DIR / f"history-{version}-{results['commit']}.json"
+    await writeJson(output, results)
+    logger.info(f"Results saved: {output}")
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+    printResults(results, baseline)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+import asyncio
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from classes.TurnProfiler import TurnProfiler
+
+
+# a turn that blocks the loop in its own task and in a child task, both have to show up as [running]
+async def turn():
+    time.sleep(0.2)
+    await asyncio.create_task(child())
+    await asyncio.sleep(0.1)
+
+
+async def child():
+    time.sleep(0.2)
+
+
+async def other():
+    while True:
+        time.sleep(0.05)
+        await asyncio.sleep(0.01)
+
+
+async def main():
+    profiler = TurnProfiler()
+    with tempfile.TemporaryDirectory() as workDir:
+        profiler.outputDir = Path(workDir)
+        profiler.arm(1)
+        background = asyncio.create_task(other())
+        async with profiler.capture("check/turn: 1"):
+            await turn()
+        background.cancel()
+        assert len(profiler.captures) == 1, profiler.captures
+        path = Path(profiler.captures[0])
+        assert path.name.endswith("-check_turn__1.folded"), path.name
+        lines = path.read_text(encoding="utf-8").splitlines()
+
+    running = [l for l in lines if l.startswith("[running]")]
+    assert any("turn (profilerCheck.py" in l for l in running), "no [running] sample inside the turn task"
+    assert any("child (profilerCheck.py" in l for l in running), "no [running] sample inside the child task"
+    assert not any("other (profilerCheck.py" in l for l in running), "work outside the turn counted as [running]"
+    print(f"ok: {sum(int(l.rsplit(' ', 1)[1]) for l in running)} running samples on python {sys.version.split()[0]}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,5 +1,5 @@
 from autogen_ext.models.openai import OpenAIChatCompletionClient
-from httpx import AsyncClient
+from .ConnectionManager import connectionManager
 
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.tools import AgentTool
@@ -10,9 +10,7 @@ if TYPE_CHECKING:
     from .Profile import Profile
     from .Server import Server
 
-http_client = AsyncClient(http2=True, timeout=30.0,)
-
-agentClient = OpenAIChatCompletionClient(model="gpt-4.1-mini", api_key=os.getenv("OPENAI_API_KEY") or "", base_url=os.getenv("OPENAI_URL") or "", parallel_tool_calls=True)
+agentClient = OpenAIChatCompletionClient(model="gpt-4.1-mini", api_key=os.getenv("OPENAI_API_KEY") or "", base_url=os.getenv("OPENAI_URL") or "", parallel_tool_calls=True, http_client=connectionManager.get("openai"))
 
 class Agent:
     def __init__(self, agent: AssistantAgent) -> None:
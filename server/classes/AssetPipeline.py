@@ -0,0 +1,91 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import multiprocessing
+import os
+from pathlib import Path
+from typing import Dict, List
+from assets import PIPELINE_VERSION, optimizeVrm
+from utils import DRIVE_PATH, logger
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .Profile import Profile
+
+
+class AssetPipeline:
+    def __init__(self):
+        self.cacheDir = DRIVE_PATH / "cache" / "vrm"
+        self.maxWorkers = int(os.getenv("ASSET_WORKERS") or 0) or None
+        self.executor: ProcessPoolExecutor | None = None
+        # one job per profile, later requests for the same profile wait on it instead of starting another
+        self.inFlight: Dict[str, asyncio.Task] = {}
+
+    def start(self):
+        if self.executor: return
+        # spawn on every platform, forking the server would copy its running threads into the workers
+        self.executor = ProcessPoolExecutor(max_workers=self.maxWorkers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def close(self):
+        if not self.executor: return
+        executor, self.executor = self.executor, None
+        await asyncio.to_thread(executor.shutdown, wait=True, cancel_futures=True)
+
+    def cacheKey(self, profile: "Profile") -> str:
+        assert profile.vrmPath
+        options = {"version": PIPELINE_VERSION, "maxTextureSize": profile.setting.vrmMaxTextureSize, "jpegQuality": profile.setting.vrmJpegQuality}
+        digest = hashlib.sha256(json.dumps(options, sort_keys=True).encode())
+        with profile.vrmPath.open("rb") as f:
+            while chunk := f.read(2**20): digest.update(chunk)
+        return digest.hexdigest()[:16]
+
+    async def optimize(self, profiles: List["Profile"]):
+        jobs: List[asyncio.Task] = []
+        for p in profiles:
+            task = self.inFlight.get(p.name)
+            if not task:
+                task = asyncio.create_task(self.optimizeProfile(p))
+                self.inFlight[p.name] = task
+                task.add_done_callback(lambda _, name=p.name: self.inFlight.pop(name, None))
+            jobs.append(task)
+        await asyncio.gather(*jobs)
+
+    async def optimizeProfile(self, p: "Profile"):
+        # only checked again when the vrm changed since the last run
+        if not p.vrmPath or not p.vrmPath.exists(): return
+        stat = p.vrmPath.stat()
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if stamp == p.vrmStamp: return
+        key = await asyncio.to_thread(self.cacheKey, p)
+        dst = self.cacheDir / f"{p.vrmPath.stem}-{key}.vrm"
+        if dst.exists() and dst.with_name(dst.name + ".gz").exists():
+            p.setOptimizedVrm(dst, key, stamp)
+            return
+
+        self.start()
+        logger.info(f"[{p.name}] Optimizing vrm {p.vrmPath}")
+        try:
+            stats = await asyncio.get_running_loop().run_in_executor(self.executor, optimizeVrm, str(p.vrmPath), str(dst), p.setting.vrmMaxTextureSize, p.setting.vrmJpegQuality)
+        except Exception as e:
+            logger.error(f"[{p.name}] Vrm optimization failed, serving the original file: {e!r}")
+            p.setOptimizedVrm(None, None, stamp)
+            return
+        logger.info(f"[{p.name}] Vrm optimized: {stats}")
+        p.setOptimizedVrm(dst, key, stamp)
+        await asyncio.to_thread(self.removeStale, dst)
+
+    def removeStale(self, dst: Path):
+        # variants built from older versions of the same vrm (or older options), the key is 16 hex characters
+        stem = dst.name[:-len(".vrm")].rsplit("-", 1)[0]
+        keep = {dst.name, dst.name + ".gz"}
+        for path in self.cacheDir.glob(f"{stem}-{'?' * 16}.vrm*"):
+            if path.name in keep or not path.name.endswith((".vrm", ".vrm.gz")): continue
+            try:
+                path.unlink()
+                logger.info(f"Removed stale vrm cache {path.name}")
+            except OSError as e:
+                logger.warning(f"Unable to remove stale vrm cache {path}: {e!r}")
+
+
+assetPipeline = AssetPipeline()
@@ -0,0 +1,117 @@
+import asyncio
+from dataclasses import dataclass, field
+import os
+import time
+from typing import Any, Dict
+from httpx import AsyncClient, Limits, Request, Timeout
+from utils import logger
+
+
+@dataclass
+class Upstream:
+    name: str
+    baseUrl: str
+    warmupPath: str
+    maxConnections: int
+    http2: bool
+    client: AsyncClient
+    requests: int = 0
+    lastActive: float = field(default_factory=time.monotonic)
+    lastPing: float = 0.0
+    warm: bool | None = None
+
+
+class ConnectionManager:
+    def __init__(self, keepAliveInterval: float = 30.0, warmupTimeout: float = 5.0):
+        self.upstreams: Dict[str, Upstream] = {}
+        self.keepAliveInterval = keepAliveInterval
+        self.warmupTimeout = warmupTimeout
+        self.keepAliveTask: asyncio.Task | None = None
+
+    def register(self, name: str, baseUrl: str, warmupPath: str = "/", http2: bool = True, timeout: Timeout | float = 30.0, maxConnections: int = 10) -> AsyncClient:
+        upstream: Upstream
+
+        async def onRequest(request: Request):
+            # warm up / keep alive pings are not real traffic
+            if request.extensions.get("keepAlivePing"): return
+            upstream.requests += 1
+            upstream.lastActive = time.monotonic()
+
+        # keepalive_expiry=None stops httpx from dropping idle connections after its default 5s,
+        # the keep alive loop below takes care of the server side idle timeout instead
+        client = AsyncClient(
+            http2=http2,
+            timeout=timeout,
+            limits=Limits(max_connections=maxConnections, max_keepalive_connections=maxConnections, keepalive_expiry=None),
+            event_hooks={"request": [onRequest]},
+        )
+        upstream = Upstream(name=name, baseUrl=baseUrl.rstrip("/"), warmupPath=warmupPath, maxConnections=maxConnections, http2=http2, client=client)
+        self.upstreams[name] = upstream
+        return client
+
+    def get(self, name: str) -> AsyncClient:
+        return self.upstreams[name].client
+
+    async def ping(self, upstream: Upstream):
+        try:
+            # any response (even 401/404) means the TCP/TLS/HTTP2 setup is done and pooled
+            upstream.lastPing = time.monotonic()
+            await upstream.client.get(upstream.baseUrl + upstream.warmupPath, timeout=self.warmupTimeout, extensions={"keepAlivePing": True})
+            if not upstream.warm: logger.info(f"Pre-connected [{upstream.name}] {upstream.baseUrl}")
+            upstream.warm = True
+        except Exception as e:
+            if upstream.warm is not False:
+                logger.warning(f"Unable to connect [{upstream.name}] {upstream.baseUrl}: {e!r}")
+            upstream.warm = False
+
+    async def warmup(self):
+        await asyncio.gather(*(self.ping(upstream) for upstream in self.upstreams.values()))
+
+    async def keepAlive(self):
+        while True:
+            await asyncio.sleep(self.keepAliveInterval)
+            now = time.monotonic()
+            idle = [u for u in self.upstreams.values() if now - max(u.lastActive, u.lastPing) >= self.keepAliveInterval]
+            await asyncio.gather(*(self.ping(upstream) for upstream in idle))
+
+    async def start(self):
+        # must run on the serving event loop, pooled connections are bound to the loop that opened them
+        await self.warmup()
+        if not self.keepAliveTask:
+            self.keepAliveTask = asyncio.create_task(self.keepAlive())
+
+    async def close(self):
+        if self.keepAliveTask:
+            self.keepAliveTask.cancel()
+            self.keepAliveTask = None
+        await asyncio.gather(*(upstream.client.aclose() for upstream in self.upstreams.values()))
+
+    def stats(self) -> Dict[str, Any]:
+        res: Dict[str, Any] = {}
+        for upstream in self.upstreams.values():
+            pool = getattr(upstream.client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            active = sum(1 for c in connections if not c.is_idle() and not c.is_closed())
+            # every request stays in the pool queue until its response is closed, whether it has a connection yet or not
+            requests = list(getattr(pool, "_requests", []))
+            queued = sum(1 for r in requests if r.is_queued())
+            res[upstream.name] = {
+                "baseUrl": upstream.baseUrl,
+                "warm": upstream.warm,
+                "requests": upstream.requests,
+                "idleSeconds": round(time.monotonic() - upstream.lastActive, 1),
+                "connections": len(connections),
+                "active": active,
+                "idle": sum(1 for c in connections if c.is_idle()),
+                "inFlight": len(requests) - queued,
+                "queued": queued,
+                "maxConnections": upstream.maxConnections,
+                # one http2 connection multiplexes many streams, busy connections say little there, see inFlight instead
+                "utilization": None if upstream.http2 else active / upstream.maxConnections,
+            }
+        return res
+
+
+connectionManager = ConnectionManager(keepAliveInterval=float(os.getenv("CONN_KEEPALIVE_INTERVAL") or 30))
+connectionManager.register("openai", baseUrl=os.getenv("OPENAI_URL") or "https://api.openai.com/v1", warmupPath="/models", http2=True, timeout=30.0)
+connectionManager.register("tts", baseUrl="http://127.0.0.1:9880", warmupPath="/", http2=False, timeout=Timeout(connect=10.0, read=120.0, write=30.0, pool=10.0))
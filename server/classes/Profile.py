@@ -1,9 +1,12 @@
 from pathlib import Path
-from typing import Annotated, List, Literal, Optional, Union
+import time
+from typing import Annotated, List, Literal, Optional, Tuple, Union
 from openai.types.responses import EasyInputMessageParam, ResponseInputParam
 from pydantic import BaseModel, Field
-from utils import getHKT, loadJson, writeJson, DRIVE_PATH
+from utils import getHKT, loadJson, logger, writeJson, DRIVE_PATH
 from agents.masterAgent import MasterAgent
+from .TurnProfiler import turnProfiler
+from .TurnRouter import Effort, RoutingPolicy, TurnRoute, TurnRouter, Verbosity
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
@@ -16,6 +19,9 @@ class History(BaseModel):
     role: Literal['user', 'assistant', 'system', 'developer']
     content: str
 
+# rough per entry footprint of a History object besides its strings, measured with tracemalloc
+HISTORY_ENTRY_OVERHEAD = 500
+
 class TTSDisabled(BaseModel):
     enabled: Literal[False]
 
@@ -27,14 +33,21 @@ class TTSEnabled(BaseModel):
     referenceTextPath: Path
     inputTextLang: str
     outputSpeedFactor: float = 1.0
+    trimSilence: bool = True
+    outputMono: bool = True
+    outputSampleRate: int | None = None
+    outputLoudness: float | None = -20.0
 
 TTSSetting = Annotated[Union[TTSDisabled, TTSEnabled], Field(discriminator="enabled")]
 
 class ProfileSetting(BaseModel):
     identity: str
     model: str
-    effort: Literal['minimal', 'low', 'medium', 'high'] | None
-    verbosity: Literal['low', 'medium', 'high'] | None
+    effort: Effort | None
+    verbosity: Verbosity | None
+    routing: RoutingPolicy | None = None
+    vrmMaxTextureSize: int | None = 2048
+    vrmJpegQuality: int | None = None
     allowedTools: List[str] | None
     platformAware: bool = False
     connectedMessage: str
@@ -51,26 +64,43 @@ class Profile:
         self.name = name
         self.setting = setting
         self.history: List[History] = []
+        self.historyLoaded = False
+        self.lastActive = 0.0
         self.masterAgent = MasterAgent()
         self.server: Server
         self.historyFile = DRIVE_PATH / "profiles" / self.name / f"history.json"
         self.vrmPath = vrmPath
+        self.vrmOptimizedPath: Path | None = None
+        self.vrmHash: str | None = None
+        self.vrmStamp: Tuple[int, int] | None = None
+        self.router = TurnRouter(setting)
+        self.turnRoute = TurnRoute(model=setting.model, effort=setting.effort, verbosity=setting.verbosity, reason="default")
 
     async def setup(self, server):
         self.server = server
         self.masterAgent.setProfile(self)
         self.masterAgent.setServer(self.server)
-        await self.loadHistory()
 
-    async def addChat(self, msg: History):
-        self.addHistory(msg)
-        await self.saveHistory()
-        await self.masterAgent.instance.run(task=f"The user asked:\n{msg}")
-        await writeJson(DRIVE_PATH / "InnerHistory.json", self.history)
-        self.history = [h for h in self.history if not h.name == "Agent"]
-        await self.saveHistory()
+    def setOptimizedVrm(self, path: Path | None, key: str | None, stamp: Tuple[int, int]):
+        self.vrmOptimizedPath = path
+        self.vrmHash = key
+        self.vrmStamp = stamp
+    def getVrmPath(self) -> Path | None:
+        return self.vrmOptimizedPath or self.vrmPath
+
+    async def addChat(self, msg: History, effort: Effort | None = None, verbosity: Verbosity | None = None):
+        async with turnProfiler.capture(self.name):
+            self.turnRoute = self.router.route(msg=msg, history=self.history, effort=effort, verbosity=verbosity)
+            self.addHistory(msg)
+            await self.saveHistory()
+            await self.masterAgent.instance.run(task=f"The user asked:\n{msg}")
+            await writeJson(DRIVE_PATH / "InnerHistory.json", self.history)
+            self.history = [h for h in self.history if not h.name == "Agent"]
+            await self.saveHistory()
 
     async def connect(self, continueChat: bool):
+        await self.ensureHistory()
+        self.lastActive = time.monotonic()
         if any(h.content == "" for h in self.history):
             self.history = [h for h in self.history if h.content != ""]
         if not continueChat and self.setting.connectedMessage:
@@ -82,6 +112,7 @@ class Profile:
             self.history = [h for h in self.history if h.content != ""]
         if self.setting.disconnectedMessage:
             self.addHistory(History(role="developer", name="System", content=self.setting.disconnectedMessage))
+        self.lastActive = time.monotonic()
         await self.saveHistory()
 
     def addHistory(self, content: History):
@@ -91,7 +122,21 @@ class Profile:
         self.history = await loadJson(self.historyFile, self.history, History)
         if any(h.content == "" for h in self.history):
             self.history = [h for h in self.history if h.content != ""]
+        self.historyLoaded = True
+    async def ensureHistory(self):
+        if not self.historyLoaded:
+            logger.info(f"[{self.name}] Loading history")
+            await self.loadHistory()
+    def releaseHistory(self):
+        # the file is up to date (saved on disconnect), the next connect loads it again
+        self.history = []
+        self.historyLoaded = False
+        logger.info(f"[{self.name}] History released")
+    def historySize(self) -> int:
+        return sum(len(h.content) + len(h.name) + len(h.time) for h in self.history) + len(self.history) * HISTORY_ENTRY_OVERHEAD
     async def saveHistory(self):
+        # nothing in memory when released, never overwrite the file with it
+        if not self.historyLoaded: return
         await writeJson(self.historyFile, self.history)
         
     def getRecentHistory(self, limit: int = 50) -> ResponseInputParam:
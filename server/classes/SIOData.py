@@ -3,6 +3,7 @@ from typing import Literal, Union
 from pydantic import BaseModel, TypeAdapter
 
 from .Profile import History
+from .TurnRouter import Effort, Verbosity
 
 # client to server
 
@@ -18,14 +19,18 @@ class LoadProfileMessage(BaseModel):
 class AddChatMessage(BaseModel):
     type: Literal["addChat"] = "addChat"
     msg: History
-    effort: Literal['minimal', 'low', 'medium', 'high'] | None = None
-    verbosity: Literal['low', 'medium', 'high'] | None = None
+    effort: Effort | None = None
+    verbosity: Verbosity | None = None
 
 class AddHistoryMessage(BaseModel):
     type: Literal["addHistory"] = "addHistory"
     msg: History
 
-ClientMessage = Union[LoadProfileMessage, AddChatMessage, AddHistoryMessage, ClientDataMessage]
+class ArmProfilerMessage(BaseModel):
+    type: Literal["armProfiler"] = "armProfiler"
+    turns: int = 1
+
+ClientMessage = Union[LoadProfileMessage, AddChatMessage, AddHistoryMessage, ClientDataMessage, ArmProfilerMessage]
 ClientMessageAdapter = TypeAdapter[ClientMessage](ClientMessage)
 
 # server to client
@@ -1,10 +1,16 @@
+import asyncio
+from contextlib import asynccontextmanager
 from dataclasses import dataclass
+import os
 import time
-from .SIOData import AddChatMessage, ClientDataMessage, LoadProfileMessage, StreamData, TextResponse
+from .SIOData import AddChatMessage, ArmProfilerMessage, ClientDataMessage, LoadProfileMessage, StreamData, TextResponse
 from .Profile import History, Profile
+from .ConnectionManager import connectionManager
+from .TurnProfiler import turnProfiler
+from .AssetPipeline import assetPipeline
 from typing import Any, AsyncGenerator, List, Optional, Type, TypeVar
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from utils import logger
@@ -22,14 +28,33 @@ class WebSocketClient():
 
 class Server:
     def __init__(self):
-        self.instance = FastAPI(root_path="/pa-server")
+        self.instance = FastAPI(root_path="/pa-server", lifespan=self.lifespan)
         self.activeProfile: Optional[Profile] = None
         self.profiles: List[Profile] = []
         self.client: WebSocketClient | None = None
         self.processing = False
         self.sio = socketio.AsyncServer(cors_allowed_origins="*",async_mode='asgi')
+        self.historyMemoryCap = int(float(os.getenv("HISTORY_MEMORY_CAP_MB") or 64) * 2**20)
+        self.assetWarmup: asyncio.Task | None = None
 
 
+    @asynccontextmanager
+    async def lifespan(self, _: FastAPI):
+        await connectionManager.start()
+        assetPipeline.start()
+        # optimize every vrm in the background, getVRM and /api/vrm wait on the in flight job of their profile
+        self.assetWarmup = asyncio.create_task(self.optimizeAssets())
+        yield
+        if not self.assetWarmup.done(): self.assetWarmup.cancel()
+        await connectionManager.close()
+        await assetPipeline.close()
+
+    async def optimizeAssets(self):
+        try:
+            await assetPipeline.optimize(self.profiles)
+        except Exception as e:
+            logger.error(f"Vrm optimization failed: {e!r}")
+
     def getApp(self):
         api = FastAPI()
         api.add_middleware(
@@ -51,6 +76,39 @@ class Server:
             logger.info(f"Return profile list - {[p.name for p in self.profiles]}")
             return JSONResponse([p.name for p in self.profiles])
 
+        @api.get("/vrm/{pName}")
+        async def vrm(pName: str, request: Request):
+            targetProfile = next((profile for profile in self.profiles if profile.name == pName), None)
+            if not targetProfile or not targetProfile.vrmPath:
+                return JSONResponse({"error": "Profile has no vrm"}, status_code=404)
+            await assetPipeline.optimize([targetProfile])
+            path = targetProfile.getVrmPath()
+            assert path
+            headers = {"Vary": "Accept-Encoding"}
+            if targetProfile.vrmHash:
+                headers["ETag"] = f'"{targetProfile.vrmHash}"'
+                # the url is the profile name, not the content, so browsers must revalidate (cheap 304 through the ETag)
+                headers["Cache-Control"] = "no-cache"
+                if request.headers.get("if-none-match") == headers["ETag"]:
+                    return Response(status_code=304, headers=headers)
+            gz = path.with_name(path.name + ".gz")
+            if targetProfile.vrmHash and "gzip" in request.headers.get("accept-encoding", "") and gz.exists():
+                headers["Content-Encoding"] = "gzip"
+                return FileResponse(gz, media_type="model/gltf-binary", headers=headers)
+            return FileResponse(path, media_type="model/gltf-binary", headers=headers)
+
+        @api.get("/connections")
+        def connections():
+            return JSONResponse(connectionManager.stats())
+
+        @api.get("/profiler")
+        def profilerStatus():
+            return JSONResponse(turnProfiler.status())
+        @api.post("/profiler")
+        def armProfiler(data: ArmProfilerMessage):
+            turnProfiler.arm(turns=data.turns)
+            return JSONResponse(turnProfiler.status())
+
         self.instance.mount("/api", api)
         self.instance.mount("/", self.initWS())
         return self.instance
@@ -58,6 +116,17 @@ class Server:
     async def addProfile(self, p: Profile):
         await p.setup(self)
         self.profiles.append(p)
+    def releaseHistory(self):
+        # every loaded history counts against the cap, the active one included, inactive ones stay loaded
+        # (switching back skips the reload) until the cap is hit, least recently active released first
+        loaded = [p for p in self.profiles if p.historyLoaded]
+        total = sum(p.historySize() for p in loaded)
+        for p in sorted((p for p in loaded if p is not self.activeProfile), key=lambda p: p.lastActive):
+            if total <= self.historyMemoryCap: break
+            total -= p.historySize()
+            p.releaseHistory()
+        if total > self.historyMemoryCap and self.activeProfile:
+            logger.warning(f"[{self.activeProfile.name}] History of the active profile alone is over HISTORY_MEMORY_CAP_MB ({total / 2**20:.1f}MB)")
     def finishTask(self):
         self.processing = False
         logger.info("Task Finished")
@@ -149,6 +218,7 @@ class Server:
             self.activeProfile = targetProfile
             logger.info(f"Activating [{targetProfile.name}] continueChat={continueChat}")
             await self.activeProfile.connect(continueChat)
+            self.releaseHistory()
             await self.success(sid=sid)
             self.finishTask()
 
@@ -166,7 +236,7 @@ class Server:
                 return
             logger.info(f'[{self.activeProfile.name}] addChat requested')
             try:
-                await self.activeProfile.addChat(msg=data.msg)
+                await self.activeProfile.addChat(msg=data.msg, effort=data.effort, verbosity=data.verbosity)
                 await self.success(sid=sid)
             except Exception as e:
                 await self.err(err=e, sid=sid)
@@ -183,6 +253,7 @@ class Server:
             logger.info(f'Unload Profile "{self.activeProfile.name}" (Exited Chat)')
             await self.activeProfile.disconnect()
             self.activeProfile = None
+            self.releaseHistory()
             await self.success(sid=sid)
             self.finishTask()
 
@@ -200,6 +271,7 @@ class Server:
                         logger.info(f'Unload Profile "{self.activeProfile.name}" (No Client)')
                         await self.activeProfile.disconnect()
                         self.activeProfile = None
+                        self.releaseHistory()
                     logger.info(f'Client sid="{sid}" disconnected, reason="{reason}" replace={replaceClient}')
                 else:
                     logger.info(f'Temp Client sid="{sid}" disconnected, reason="{reason}"')
@@ -210,6 +282,14 @@ class Server:
             logger.info(f"Return profile list (SIO) - {[p.name for p in self.profiles]}")
             await self.emit(ev="profilesData", sid=sid, data=[{"name": p.name, "vrm": not p.vrmPath == None} for p in self.profiles])
         
+        @self.sio.event
+        async def armProfiler(sid, data):
+            if not self.client or not self.client.sid == sid: return
+            data = await expectData(sid=sid, data=data, model=ArmProfilerMessage)
+            if not data: return
+            turnProfiler.arm(turns=data.turns)
+            await self.success(sid=sid, data=turnProfiler.status())
+
         @self.sio.event
         async def getVRM(sid, pName):
             if not self.client or not self.client.sid == sid: return
@@ -220,6 +300,8 @@ class Server:
             if not targetProfile.vrmPath:
                 await self.err(err="Profile has no vrm", sid=sid)
                 return
+            await assetPipeline.optimize([targetProfile])
+            path = targetProfile.getVrmPath()
             logger.info(f"Return profile vrm (SIO) - {targetProfile.name}")
-            await self.emit(ev="profileVRM", sid=sid, data=targetProfile.vrmPath.read_bytes())
+            await self.emit(ev="profileVRM", sid=sid, data=await asyncio.to_thread(path.read_bytes))  # type: ignore
         return socketio.ASGIApp(socketio_server=self.sio, socketio_path="/pa-server/socket.io/")
\ No newline at end of file
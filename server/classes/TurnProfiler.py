@@ -0,0 +1,162 @@
+import asyncio
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+import re
+import sys
+import threading
+import time
+from types import CodeType
+from typing import Any, Dict, List
+from weakref import WeakSet
+from utils import DRIVE_PATH, logger
+
+# set while a turn is captured, every task the turn spawns inherits it
+turnLabel: ContextVar[str | None] = ContextVar("turnLabel", default=None)
+
+
+def frameName(code: CodeType) -> str:
+    return f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, loop: asyncio.AbstractEventLoop, task: asyncio.Task, turnTasks: "WeakSet[asyncio.Task]", targetThread: int, interval: float):
+        super().__init__(name="TurnProfilerSampler", daemon=True)
+        self.loop = loop
+        self.task = task
+        self.turnTasks = turnTasks
+        self.targetThread = targetThread
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self.stopEvent = threading.Event()
+
+    def threadStack(self) -> List[str]:
+        frame = sys._current_frames().get(self.targetThread)
+        stack: List[str] = []
+        while frame is not None:
+            stack.append(frameName(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        # start at the callback the loop is running, the runner / loop frames above it are the same in every sample
+        runIndex = next((i for i in range(len(stack) - 1, -1, -1) if stack[i].startswith("_run (events.py")), None)
+        return stack[runIndex + 1:] if runIndex is not None else stack
+
+    def awaitChain(self) -> List[str]:
+        # follow what the turn task is suspended on, coroutine by coroutine, down to the future it waits for
+        chain: List[str] = []
+        awaitable: Any = self.task
+        while awaitable is not None and len(chain) < 200:
+            if isinstance(awaitable, asyncio.Task):
+                awaitable = awaitable.get_coro()
+                continue
+            frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None) or getattr(awaitable, "gi_frame", None)
+            if frame is None:
+                # the future at the bottom, awaited through its C iterator
+                chain.append(type(awaitable).__name__.replace("FutureIter", "Future"))
+                break
+            chain.append(frameName(frame.f_code))
+            awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+        return chain
+
+    def runningTask(self) -> asyncio.Task | None:
+        try:
+            tasks = asyncio.all_tasks(self.loop)
+        except RuntimeError:
+            return None
+        return next((t for t in tasks if getattr(t.get_coro(), "cr_running", False)), None)
+
+    def sample(self):
+        stack = self.threadStack()
+        running = self.runningTask()
+        if running is not None and running in self.turnTasks:
+            # the turn (or a task it spawned) is on the loop thread, blocking calls show up here
+            self.samples[";".join(["[running]"] + stack)] += 1
+        elif not self.task.done():
+            chain = ["[awaiting]"] + self.awaitChain()
+            if stack and stack[-1].startswith("select (selectors.py"):
+                chain.append("[loop idle]")
+            else:
+                # the turn is ready or waiting while unrelated loop work holds the thread
+                chain += ["[other loop work]"] + stack
+            self.samples[";".join(chain)] += 1
+
+    def run(self):
+        while not self.stopEvent.wait(self.interval):
+            try:
+                self.sample()
+            except Exception:
+                # the loop thread keeps running while we read its tasks, a torn read just loses one sample
+                pass
+
+    def stop(self):
+        self.stopEvent.set()
+        self.join()
+
+
+# samples the event loop thread during armed turns and writes collapsed stacks (.folded, for speedscope / flamegraph.pl)
+# [running] is time the turn holds the loop (blocking calls are wide frames there), [awaiting] is split by the await chain
+# nothing runs when not armed, the sampler thread only exists during a captured turn
+class TurnProfiler:
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.remaining = 0
+        self.outputDir = DRIVE_PATH / "profiler"
+        self.captures: List[str] = []
+
+    def arm(self, turns: int = 1):
+        self.remaining = max(turns, 0)
+        logger.info(f"Turn profiler armed for {self.remaining} turn(s)")
+
+    def status(self) -> Dict[str, Any]:
+        return {"remaining": self.remaining, "interval": self.interval, "captures": self.captures[-10:]}
+
+    @asynccontextmanager
+    async def capture(self, label: str):
+        task = asyncio.current_task()
+        if self.remaining <= 0 or task is None:
+            yield
+            return
+        self.remaining -= 1
+        loop = asyncio.get_running_loop()
+        turnTasks: WeakSet[asyncio.Task] = WeakSet([task])
+        previousFactory = loop.get_task_factory()
+
+        # task contexts can't be read from the sampler thread on 3.11, so tasks spawned under the turn are collected as they are created
+        def taskFactory(loop: asyncio.AbstractEventLoop, coro, **kwargs):
+            child = previousFactory(loop, coro, **kwargs) if previousFactory else asyncio.Task(coro, loop=loop, **kwargs)
+            context = kwargs.get("context")
+            if (context.get(turnLabel) if context is not None else turnLabel.get()) is not None: turnTasks.add(child)
+            return child
+
+        token = turnLabel.set(label)
+        loop.set_task_factory(taskFactory)
+        sampler = StackSampler(loop=loop, task=task, turnTasks=turnTasks, targetThread=threading.get_ident(), interval=self.interval)
+        start = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            turnLabel.reset(token)
+            if loop.get_task_factory() is taskFactory: loop.set_task_factory(previousFactory)
+            await asyncio.to_thread(sampler.stop)
+            duration = time.perf_counter() - start
+            name = re.sub(r"[^A-Za-z0-9_-]", "_", label)
+            path = self.outputDir / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{name}.folded"
+            try:
+                await asyncio.to_thread(self.write, path, sampler.samples)
+                self.captures.append(str(path))
+                logger.info(f"Turn profile saved: {path} ({duration:.3f}s, {sum(sampler.samples.values())} samples)")
+            except Exception as e:
+                # the turn itself went through, a lost profile must not turn it into a failed chat
+                logger.warning(f"Unable to save turn profile {path}: {e!r}")
+
+    def write(self, path: Path, samples: Counter[str]):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+turnProfiler = TurnProfiler()
@@ -0,0 +1,73 @@
+from collections import deque
+from dataclasses import dataclass
+import statistics
+from typing import Deque, Dict, List, Literal, Optional
+from pydantic import BaseModel
+from utils import logger
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from .Profile import History, ProfileSetting
+
+Effort = Literal['minimal', 'low', 'medium', 'high']
+Verbosity = Literal['low', 'medium', 'high']
+
+
+class RoutingPolicy(BaseModel):
+    fastModel: str
+    fastEffort: Optional[Effort] = None
+    fastVerbosity: Optional[Verbosity] = None
+    # messages up to this many characters count as chit-chat
+    shortMessageLength: int = 120
+    # seconds to first delta, when the main model is slower than this, medium sized messages go to the fast model too
+    latencyTarget: Optional[float] = None
+
+
+@dataclass
+class TurnRoute:
+    model: str
+    effort: Optional[Effort]
+    verbosity: Optional[Verbosity]
+    reason: str
+
+
+class TurnRouter:
+    def __init__(self, setting: "ProfileSetting", latencyWindow: int = 10):
+        self.setting = setting
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.latencyWindow = latencyWindow
+
+    def recordLatency(self, model: str, ttfd: float):
+        self.latencies.setdefault(model, deque(maxlen=self.latencyWindow)).append(ttfd)
+
+    def recentLatency(self, model: str) -> float | None:
+        samples = self.latencies.get(model)
+        return statistics.median(samples) if samples else None
+
+    def route(self, msg: "History", history: List["History"], effort: Optional[Effort] = None, verbosity: Optional[Verbosity] = None) -> TurnRoute:
+        setting = self.setting
+        policy = setting.routing
+        res = TurnRoute(model=setting.model, effort=setting.effort, verbosity=setting.verbosity, reason="default")
+
+        if policy:
+            deepDive = msg.deepDive == "start" or sum(1 for h in history if h.deepDive == "start") > sum(1 for h in history if h.deepDive == "end")
+            length = len(msg.content)
+            latency = self.recentLatency(setting.model)
+            fast = TurnRoute(model=policy.fastModel, effort=policy.fastEffort, verbosity=policy.fastVerbosity, reason="")
+            if deepDive:
+                res.reason = "deep dive"
+            elif effort in ("medium", "high"):
+                res.reason = f"client effort {effort}"
+            elif length <= policy.shortMessageLength:
+                res = fast
+                res.reason = f"short message ({length} chars)"
+            elif policy.latencyTarget and latency and latency > policy.latencyTarget and length <= policy.shortMessageLength * 2:
+                res = fast
+                res.reason = f"main model slow ({latency:.2f}s > {policy.latencyTarget:.2f}s)"
+
+        # explicit client hints win, but only for a model configured with them, models without reasoning reject effort
+        # and most models only accept the default verbosity
+        if effort and res.effort is not None: res.effort = effort
+        if verbosity and res.verbosity is not None: res.verbosity = verbosity
+        logger.info(f"Route: model={res.model} effort={res.effort} verbosity={res.verbosity} ({res.reason})")
+        return res
@@ -2,10 +2,7 @@ from typing import Optional
 from pydantic import BaseModel, ValidationError
 import yaml
 from utils import PROJECT_ROOT, loadEnv, logger
-loadEnv()
-
-from classes.Server import Server
-server = Server()
+from classes.TurnRouter import Effort, RoutingPolicy, Verbosity
 
 
 class ProfileConfig(BaseModel):
@@ -18,6 +15,11 @@ class ProfileConfig(BaseModel):
     # optional with defaults
     connectedMessage: str = "The user just connected"
     disconnectedMessage: str = "The user disconnected"
+    effort: Optional[Effort] = None
+    verbosity: Optional[Verbosity] = "medium"
+    routing: Optional[RoutingPolicy] = None
+    vrmMaxTextureSize: Optional[int] = 2048
+    vrmJpegQuality: Optional[int] = None
 
     # conditionally required
     referenceText: Optional[str] = None
@@ -25,6 +27,12 @@ class ProfileConfig(BaseModel):
     inputTextLang: Optional[str] = None
     outputSpeedFactor: Optional[float] = None
 
+    # optional tts post processing, the defaults live in TTSEnabled, only the fields set in the yml are passed on
+    trimSilence: Optional[bool] = None
+    outputMono: Optional[bool] = None
+    outputSampleRate: Optional[int] = None
+    outputLoudness: Optional[float] = None
+
     # extra validation rule
     def validate_tts(self):
         if self.ttsEnabled:
@@ -35,11 +43,19 @@ class ProfileConfig(BaseModel):
             ]
             if missing:
                 raise ValueError(f"ttsEnabled is true, but missing required fields: {missing}")
+            empty = [field for field in ["trimSilence", "outputMono"] if field in self.model_fields_set and getattr(self, field) is None]
+            if empty:
+                raise ValueError(f"fields must be true or false when set: {empty}")
 
 
 
 
 def main():
+    # the env and the server only load here, process pool workers (spawn) re-import this file and must stay light
+    loadEnv()
+    from classes.Server import Server
+    server = Server()
+
     import warnings
     import logging
     from rich.traceback import install
@@ -54,8 +70,6 @@ def main():
     
     import asyncio
     async def setup_application():
-        global server
-
         profiles_dir = PROJECT_ROOT / "profiles"
         from classes.Profile import Profile, ProfileSetting, TTSDisabled, TTSEnabled
         for yml_file in profiles_dir.rglob("*.yml"):
@@ -87,8 +101,11 @@ def main():
                     vrmPath=vrm_file if vrm_file.exists() else None,
                     setting=ProfileSetting(
                         model=pData.model,
-                        effort=None,
-                        verbosity="medium",
+                        effort=pData.effort,
+                        verbosity=pData.verbosity,
+                        routing=pData.routing,
+                        vrmMaxTextureSize=pData.vrmMaxTextureSize,
+                        vrmJpegQuality=pData.vrmJpegQuality,
                         allowedTools=None,
                         connectedMessage=pData.connectedMessage,
                         disconnectedMessage=pData.disconnectedMessage,
@@ -100,7 +117,8 @@ def main():
                             referenceTextLang=pData.referenceTextLang or "",
                             referenceTextPath=audio_file,
                             inputTextLang=pData.inputTextLang or "",
-                            outputSpeedFactor=pData.outputSpeedFactor or 1.0
+                            outputSpeedFactor=pData.outputSpeedFactor or 1.0,
+                            **pData.model_dump(include={"trimSilence", "outputMono", "outputSampleRate", "outputLoudness"}, exclude_unset=True)
                         ) if pData.ttsEnabled else TTSDisabled(enabled=False)
                     )
                 )
@@ -114,7 +132,9 @@ def main():
 
     return asyncio.run(setup_application())
 
-app = main()
+# process pool workers re-import this file as __mp_main__ (spawn), they must not start the server
+if __name__ != "__mp_main__":
+    app = main()
 
 if __name__ == "__main__":
     logger.info("Running Server")
@@ -8,6 +8,10 @@ from dotenv import load_dotenv
 from pydantic import BaseModel, TypeAdapter
 import pytz
 
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from classes.Profile import TTSEnabled
+
 async def writeJson(path: Path, data):
     path.parent.mkdir(parents=True, exist_ok=True)
     def write_file():
@@ -59,17 +63,19 @@ def outputClean(text: str) -> str:
     text = re.sub(r'\s+', ' ', text).strip()
     return text
 
-async def genTTSAudio(inputText: str, inputLang: str, refPath: Path, refText: str, refLang: str, speed: float, tokenSize: int) -> bytes | None:
-    import httpx
+async def genTTSAudio(inputText: str, inputLang: str, tts: "TTSEnabled", tokenSize: int) -> bytes | None:
+    from classes.ConnectionManager import connectionManager
+    from audio import processWav
     try:
-        BASE_URL = "http://127.0.0.1:9880/tts"
+        client = connectionManager.get("tts")
+        BASE_URL = connectionManager.upstreams["tts"].baseUrl + "/tts"
         payload = {
             "text": outputClean(inputText),
             "text_lang": inputLang,
-            "ref_audio_path": str(refPath),
+            "ref_audio_path": str(tts.referenceTextPath),
             "aux_ref_audio_paths": [],
-            "prompt_text": refText,
-            "prompt_lang": refLang,
+            "prompt_text": tts.referenceText,
+            "prompt_lang": tts.referenceTextLang,
             "top_k": 15,
             "top_p": 1,
             "temperature": 1,
@@ -77,7 +83,7 @@ async def genTTSAudio(inputText: str, inputLang: str, refPath: Path, refText: st
             # "batch_size": 1,
             # "batch_threshold": 0.75,
             # "split_bucket": True,
-            "speed_factor": speed,
+            "speed_factor": tts.outputSpeedFactor,
             "streaming_mode": False,
             # "seed": -1,
             "parallel_infer": True,
@@ -87,15 +93,19 @@ async def genTTSAudio(inputText: str, inputLang: str, refPath: Path, refText: st
         }
 
         logger.info(f"Fetching GPT SoVITS ({tokenSize} tokens)...")
-        timeout = httpx.Timeout(connect=10.0, read=120.0, write=30.0, pool=10.0)
-
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            resp = await client.post(BASE_URL, json=payload)
-            if resp.status_code == 200:
+        resp = await client.post(BASE_URL, json=payload)
+        if resp.status_code == 200:
+            if not (tts.trimSilence or tts.outputMono or tts.outputSampleRate or tts.outputLoudness is not None): return resp.content
+            try:
+                audio = await asyncio.to_thread(processWav, resp.content, trim=tts.trimSilence, mono=tts.outputMono, sampleRate=tts.outputSampleRate, loudness=tts.outputLoudness)
+                logger.info(f"Audio processed: {len(resp.content)} -> {len(audio)} bytes")
+                return audio
+            except Exception as e:
+                logger.warning(f"Audio processing failed, sending raw audio: {e!r}")
                 return resp.content
-            else:
-                logger.error("Fetch failed: %s %s", resp.status_code, resp.text)
-                return None
+        else:
+            logger.error("Fetch failed: %s %s", resp.status_code, resp.text)
+            return None
     except Exception as e:
         logger.error(repr(e))
         return None